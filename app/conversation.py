@@ -0,0 +1,235 @@
+# app/conversation.py
+"""
+Conversational retrieval helpers.
+
+Follow-up questions ("what about the second one?") are turned into a
+standalone query using the recent chat history, optionally expanded into a
+few query variants, embedded in one batch and searched with a single
+batched FAISS call. Results of the variants are merged with reciprocal rank
+fusion.
+"""
+from app.metrics import metrics
+
+
+def count_tokens(text: str, tokenizer=None) -> int:
+    """Count tokens with ``tokenizer`` or approximate them by whitespace words."""
+    if tokenizer is not None:
+        return len(tokenizer.encode(text, add_special_tokens=False))
+    return len(text.split())
+
+
+def truncate_tokens(text: str, max_tokens: int, tokenizer=None) -> str:
+    """Cut ``text`` to at most ``max_tokens`` tokens, counted the same way as count_tokens."""
+    if max_tokens <= 0:
+        return ""
+    if tokenizer is None:
+        return " ".join(text.split()[:max_tokens])
+
+    ids = tokenizer.encode(text, add_special_tokens=False)
+    limit = max_tokens
+    while True:
+        truncated = tokenizer.decode(ids[:limit], skip_special_tokens=True)
+        # Decoding can merge pieces differently, so re-count before accepting
+        if limit <= 0 or count_tokens(truncated, tokenizer) <= max_tokens:
+            return truncated
+        limit -= 1
+
+
+def format_history(history) -> str:
+    """Render (question, answer) turns as a User/Assistant transcript."""
+    return "\n".join(f"User: {q}\nAssistant: {a}" for q, a in history)
+
+
+def trim_history(history, max_tokens: int = 128, tokenizer=None):
+    """
+    Keeps the most recent chat turns that fit in a token budget.
+
+    Args:
+        history (list): (question, answer) tuples, oldest first
+        max_tokens (int): Token budget for questions and answers combined
+        tokenizer: Optional tokenizer used for counting
+    Returns:
+        list: The most recent turns that fit, oldest first
+    """
+    kept = []
+    used = 0
+    for question, answer in reversed(history):
+        cost = count_tokens(question, tokenizer) + count_tokens(answer, tokenizer)
+        if used + cost <= max_tokens:
+            kept.append((question, answer))
+            used += cost
+            continue
+        if not kept:
+            # The latest turn alone is over budget: keep as much of it as
+            # fits, question first, then the answer in the remaining budget
+            question = truncate_tokens(question, max_tokens, tokenizer)
+            remaining = max_tokens - count_tokens(question, tokenizer)
+            answer = truncate_tokens(answer, remaining, tokenizer)
+            kept.append((question, answer))
+        break
+    kept.reverse()
+    return kept
+
+
+def fit_history(history, max_tokens: int, tokenizer=None):
+    """
+    Trims history so its formatted User/Assistant transcript fits ``max_tokens``.
+
+    trim_history budgets the raw questions and answers; the transcript also
+    spends tokens on the speaker labels, so shrink until it really fits.
+    """
+    budget = max_tokens
+    while budget > 0:
+        recent = trim_history(history, budget, tokenizer)
+        overshoot = count_tokens(format_history(recent), tokenizer) - max_tokens
+        if overshoot <= 0:
+            return recent
+        budget -= overshoot
+    return []
+
+
+def condense_question(question: str, history, llm=None) -> str:
+    """
+    Turns a follow-up question into a standalone query.
+
+    Without ``llm`` the previous turn is folded into the query text, which
+    costs no model call. With ``llm`` one generation rewrites the question.
+
+    Args:
+        question (str): Latest user question
+        history (list): Trimmed (question, answer) tuples, oldest first
+        llm: Optional LLM used to rewrite the question
+    """
+    if not history:
+        return question
+
+    if llm is None:
+        last_question, last_answer = history[-1]
+        return f"{question} {last_question} {last_answer}".strip()
+
+    transcript = format_history(history)
+    prompt = f"""
+Rewrite the follow-up question as a standalone question using the conversation.
+
+Conversation:
+{transcript}
+
+Follow-up question: {question}
+
+Standalone question:
+"""
+    standalone = str(llm.invoke(prompt)).strip()
+    return standalone or question
+
+
+def expand_queries(question: str, standalone: str, history):
+    """
+    Builds query variants for multi-query retrieval.
+
+    Args:
+        question (str): Latest user question as typed
+        standalone (str): Condensed standalone query
+        history (list): Trimmed (question, answer) tuples, oldest first
+    Returns:
+        list: Unique query strings, standalone query first
+    """
+    variants = [standalone, question]
+    if history:
+        variants.append(f"{history[-1][0]} {question}")
+        variants.append(" ".join(q for q, _ in history) + f" {question}")
+
+    unique = []
+    for variant in variants:
+        if variant and variant not in unique:
+            unique.append(variant)
+    return unique
+
+
+def batched_search(vector_store, queries, k: int = 3):
+    """
+    Embeds all queries in one batch and runs a single FAISS search.
+
+    Args:
+        vector_store: LangChain FAISS vector store
+        queries (list): Query strings
+        k (int): Results per query
+    Returns:
+        list: One list of (Document, score) per query, best first
+    """
+    import numpy as np
+
+    with metrics.span("embedding.query_batch", size=len(queries)):
+        vectors = vector_store.embedding_function.embed_documents(queries)
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if getattr(vector_store, "_normalize_L2", False):
+        import faiss
+        faiss.normalize_L2(matrix)
+
+    with metrics.span("retrieval.faiss_search", queries=len(queries), k=k):
+        scores, indices = vector_store.index.search(matrix, k)
+
+    results = []
+    for row_scores, row_indices in zip(scores, indices):
+        hits = []
+        for score, index in zip(row_scores, row_indices):
+            if index == -1:
+                continue
+            doc_id = vector_store.index_to_docstore_id[index]
+            hits.append((vector_store.docstore.search(doc_id), float(score)))
+        results.append(hits)
+    return results
+
+
+def reciprocal_rank_fusion(result_lists, top_n: int = 3, rank_constant: int = 60):
+    """
+    Merges ranked result lists with reciprocal rank fusion.
+
+    Args:
+        result_lists (list): Lists of (Document, score), best first
+        top_n (int): Number of documents to return
+        rank_constant (int): RRF damping constant
+    Returns:
+        list: Fused documents, best first
+    """
+    fused = {}
+    for hits in result_lists:
+        for rank, (doc, _) in enumerate(hits):
+            key = doc.page_content
+            score, _ = fused.get(key, (0.0, doc))
+            fused[key] = (score + 1.0 / (rank_constant + rank + 1), doc)
+
+    ranked = sorted(fused.values(), key=lambda item: item[0], reverse=True)
+    return [doc for _, doc in ranked[:top_n]]
+
+
+def retrieve_with_history(vector_store, question: str, history, k: int = 3,
+                          multi_query: bool = True, max_history_tokens: int = 128,
+                          tokenizer=None, llm=None):
+    """
+    Retrieves documents for a follow-up question using the chat history.
+
+    Args:
+        vector_store: LangChain FAISS vector store
+        question (str): Latest user question
+        history (list): (question, answer) tuples, oldest first
+        k (int): Number of documents to return
+        multi_query (bool): Search several query variants and fuse them
+        max_history_tokens (int): Token budget for the history
+        tokenizer: Optional tokenizer used for the budget
+        llm: Optional LLM used to condense the question
+    Returns:
+        tuple: (standalone query, list of Documents, trimmed history)
+    """
+    with metrics.span("retrieval.condense") as span:
+        recent = trim_history(history, max_history_tokens, tokenizer)
+        standalone = condense_question(question, recent, llm)
+        span.set(turns=len(recent))
+
+    queries = expand_queries(question, standalone, recent) if multi_query else [standalone]
+    # Over-fetch per variant so fusion has candidates to choose from
+    fetch_k = k * 2 if len(queries) > 1 else k
+    result_lists = batched_search(vector_store, queries, fetch_k)
+
+    with metrics.span("retrieval.fuse", queries=len(queries)):
+        documents = reciprocal_rank_fusion(result_lists, top_n=k)
+    return standalone, documents, recent
@@ -1,18 +1,93 @@
 # app/embedder.py
 import os
-from dotenv import load_dotenv
-from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_openai import OpenAIEmbeddings
-from langchain.docstore.document import Document
+from functools import lru_cache
+from app.metrics import metrics
 from app.utils import save_faiss_index
 
-load_dotenv()
+HF_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Embedding models are loaded on first use and reused afterwards
+_embeddings_cache = {}
+
+
+def get_embeddings(use_openai: bool = False):
+    """
+    Returns the embedding model, loading it (and its heavy imports) on first use.
+
+    Args:
+        use_openai (bool): Use OpenAI embeddings instead of local HuggingFace ones
+    """
+    cached = _embeddings_cache.get(use_openai)
+    metrics.record_cache("embeddings_model", cached is not None)
+    if cached is not None:
+        return cached
+
+    if use_openai:
+        from dotenv import load_dotenv
+        from langchain_openai import OpenAIEmbeddings
+
+        load_dotenv()
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError("Missing OPENAI_API_KEY in .env file")
+        print("🔹 Using OpenAI embeddings...")
+        embeddings = OpenAIEmbeddings(model="text-embedding-ada-002", openai_api_key=api_key) # type: ignore
+    else:
+        from langchain_huggingface import HuggingFaceEmbeddings
+
+        print("🔹 Using HuggingFace embeddings (offline)...")
+        with metrics.span("embedding.load", model=HF_EMBEDDING_MODEL):
+            embeddings = HuggingFaceEmbeddings(model_name=HF_EMBEDDING_MODEL)
+
+    _embeddings_cache[use_openai] = embeddings
+    return embeddings
+
+
+@lru_cache(maxsize=None)
+def _traced_embeddings_class():
+    """Defines TracedEmbeddings on first use so langchain_core is not imported at module load."""
+    from langchain_core.embeddings import Embeddings
+
+    class TracedEmbeddings(Embeddings):
+        """Wraps an embedding model so every batch and query embedding is timed."""
+
+        def __init__(self, embeddings, batch_size: int = 64):
+            self.embeddings = embeddings
+            self.batch_size = batch_size
+
+        def embed_documents(self, texts):
+            vectors = []
+            for start in range(0, len(texts), self.batch_size):
+                batch = texts[start:start + self.batch_size]
+                with metrics.span("embedding.batch", size=len(batch)):
+                    vectors.extend(self.embeddings.embed_documents(batch))
+            return vectors
+
+        def embed_query(self, text):
+            with metrics.span("embedding.query"):
+                return self.embeddings.embed_query(text)
+
+    return TracedEmbeddings
+
+
+def traced_embeddings(embeddings, batch_size: int = 64):
+    """
+    Wraps an embedding model so every batch and query embedding is timed.
+
+    Args:
+        embeddings: Embedding model to delegate to
+        batch_size (int): Number of texts embedded per traced batch
+    """
+    return _traced_embeddings_class()(embeddings, batch_size)
+
 
 def create_faiss_index(input_path: str, index_path: str, use_openai: bool = False):
     """
     Creates a FAISS vector index from text chunks.
     """
+    from langchain_community.vectorstores import FAISS
+    from langchain.docstore.document import Document
+
     if not os.path.exists(input_path):
         raise FileNotFoundError(f"Chunks file not found: {input_path}")
 
@@ -25,18 +100,11 @@ def create_faiss_index(input_path: str, index_path: str, use_openai: bool = Fals
     documents = [Document(page_content=chunk) for chunk in chunks]
 
     # Choose embeddings
-    if use_openai:
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("Missing OPENAI_API_KEY in .env file")
-        print("🔹 Using OpenAI embeddings...")
-        embeddings = OpenAIEmbeddings(model="text-embedding-ada-002", openai_api_key=api_key) # type: ignore
-    else:
-        print("🔹 Using HuggingFace embeddings (offline)...")
-        embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+    embeddings = get_embeddings(use_openai)
 
     # Create FAISS index
-    vector_store = FAISS.from_documents(documents, embeddings)
+    with metrics.span("faiss.build", documents=len(documents)):
+        vector_store = FAISS.from_documents(documents, traced_embeddings(embeddings))
 
     # Save FAISS index using utils
     save_faiss_index(vector_store, index_path)
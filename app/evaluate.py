@@ -0,0 +1,282 @@
+# app/evaluate.py
+"""
+Offline retrieval evaluation and chunk-parameter autotuning.
+
+Sweeps chunk size, chunk overlap, k and FAISS index type over a PDF and a
+set of question / expected-passage pairs, measures recall@k, MRR, index
+size, ingest time, query latency and context size, and recommends a
+configuration.
+
+Run from the project root:
+    python -m app.evaluate internship.pdf data/eval_questions.json
+    python -m app.evaluate internship.pdf data/eval_questions.json --save
+
+The questions file is a JSON list (or JSONL) of objects with "question" and
+"expected" (a passage that answers it, copied from the document).
+"""
+import argparse
+import itertools
+import json
+import os
+import re
+import time
+
+DEFAULT_CHUNK_SIZES = [300, 500, 800, 1200]
+DEFAULT_CHUNK_OVERLAPS = [0, 50, 100]
+DEFAULT_KS = [1, 3, 5]
+DEFAULT_INDEX_TYPES = ["flat", "hnsw", "ivf"]
+
+RESULTS_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "eval_results.json")
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def load_questions(path: str):
+    """
+    Loads question / expected-passage pairs from a JSON or JSONL file.
+
+    Returns:
+        list of dicts with "question" and "expected"
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Questions file not found: {path}")
+
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read().strip()
+    if content.startswith("["):
+        pairs = json.loads(content)
+    else:
+        pairs = [json.loads(line) for line in content.splitlines() if line.strip()]
+
+    if not pairs:
+        raise ValueError(f"No question / expected-passage pairs found in {path}")
+    for pair in pairs:
+        if not pair.get("question") or not pair.get("expected"):
+            raise ValueError(f"Each entry needs 'question' and 'expected': {pair}")
+    return pairs
+
+
+def _words(text: str):
+    return set(_WORD_RE.findall(text.lower()))
+
+
+def is_relevant(chunk: str, expected: str, threshold: float = 0.8) -> bool:
+    """
+    Decides whether retrieved text contains the expected passage.
+
+    Scores coverage: the share of the expected passage's words found in
+    ``chunk``. A fragment of the passage, or a neighbouring table row that
+    shares most of its wording, falls short; pass the retrieved chunks
+    joined together to count a passage split across chunks.
+    """
+    expected_words = _words(expected)
+    if not expected_words:
+        return False
+    return len(_words(chunk) & expected_words) / len(expected_words) >= threshold
+
+
+def build_index(index_type: str, vectors):
+    """
+    Builds a FAISS index of the given type over ``vectors``.
+
+    Args:
+        index_type (str): "flat" (exact), "hnsw" (graph) or "ivf" (clustered)
+        vectors: float32 array of shape (n, dim)
+    """
+    import faiss
+
+    count, dim = vectors.shape
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, 32)
+    elif index_type == "ivf":
+        nlist = max(1, int(count ** 0.5))
+        index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dim), dim, nlist)
+        index.train(vectors)
+        index.nprobe = min(nlist, 8)
+    else:
+        raise ValueError(f"Unknown index type: {index_type}")
+
+    index.add(vectors)
+    return index
+
+
+def _chunk_document(source, chunk_size, chunk_overlap, layout_aware):
+    if layout_aware:
+        from app.text_splitter import split_blocks
+        return [chunk for chunk, _ in split_blocks(source, chunk_size, chunk_overlap)]
+    from app.text_splitter import split_text
+    return split_text(source, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+def evaluate(pdf_path: str, pairs, chunk_sizes=DEFAULT_CHUNK_SIZES,
+             chunk_overlaps=DEFAULT_CHUNK_OVERLAPS, ks=DEFAULT_KS,
+             index_types=DEFAULT_INDEX_TYPES, layout_aware: bool = True,
+             threshold: float = 0.8):
+    """
+    Runs the parameter sweep.
+
+    Chunking and embedding run once per (chunk size, overlap); every index
+    type is built from the same vectors, and all questions are searched in
+    one batched call at the largest k, then scored for each smaller k.
+
+    Args:
+        pdf_path (str): PDF to evaluate on
+        pairs (list): Question / expected-passage dicts
+        chunk_sizes, chunk_overlaps, ks, index_types (list): Sweep grid
+        layout_aware (bool): Use layout blocks (the UI default) instead of flat text
+        threshold (float): Share of the expected passage's words the retrieved chunks must cover
+    Returns:
+        list of result dicts, one per configuration
+    """
+    if not pairs:
+        raise ValueError("At least one question / expected-passage pair is needed")
+
+    import faiss
+    import numpy as np
+    from app.embedder import get_embeddings
+    from app.pdf_handler import extract_blocks_from_pdf, extract_text_from_pdf
+
+    start = time.perf_counter()
+    source = extract_blocks_from_pdf(pdf_path) if layout_aware else extract_text_from_pdf(pdf_path)
+    extract_seconds = time.perf_counter() - start
+    if not source:
+        raise RuntimeError(f"❌ Could not extract text from {pdf_path}")
+
+    embeddings = get_embeddings()
+    questions = [pair["question"] for pair in pairs]
+
+    # Question vectors do not depend on chunking, so embed them once
+    start = time.perf_counter()
+    query_vectors = np.asarray(embeddings.embed_documents(questions), dtype=np.float32)
+    query_embed_seconds = (time.perf_counter() - start) / len(questions)
+
+    max_k = max(ks)
+    results = []
+    for chunk_size, chunk_overlap in itertools.product(chunk_sizes, chunk_overlaps):
+        if chunk_overlap >= chunk_size:
+            continue
+
+        start = time.perf_counter()
+        chunks = [c for c in _chunk_document(source, chunk_size, chunk_overlap, layout_aware) if c.strip()]
+        vectors = np.asarray(embeddings.embed_documents(chunks), dtype=np.float32)
+        embed_seconds = time.perf_counter() - start
+        print(f"🔹 chunk_size={chunk_size} overlap={chunk_overlap}: {len(chunks)} chunks")
+
+        for index_type in index_types:
+            start = time.perf_counter()
+            index = build_index(index_type, vectors)
+            build_seconds = time.perf_counter() - start
+            index_bytes = len(faiss.serialize_index(index))
+
+            start = time.perf_counter()
+            _, indices = index.search(query_vectors, min(max_k, len(chunks)))
+            search_seconds = (time.perf_counter() - start) / len(questions)
+
+            for k in ks:
+                hits = 0
+                reciprocal_ranks = 0.0
+                context_words = 0
+                for pair, row in zip(pairs, indices):
+                    retrieved = [chunks[i] for i in row[:k] if i != -1]
+                    context_words += sum(len(chunk.split()) for chunk in retrieved)
+                    # The passage counts as found at the first rank where the
+                    # chunks retrieved so far cover it together
+                    for rank in range(1, len(retrieved) + 1):
+                        if is_relevant("\n".join(retrieved[:rank]), pair["expected"], threshold):
+                            hits += 1
+                            reciprocal_ranks += 1.0 / rank
+                            break
+
+                results.append({
+                    "chunk_size": chunk_size,
+                    "chunk_overlap": chunk_overlap,
+                    "k": k,
+                    "index_type": index_type,
+                    "layout_aware": layout_aware,
+                    "chunks": len(chunks),
+                    "recall_at_k": hits / len(pairs),
+                    "mrr": reciprocal_ranks / len(pairs),
+                    "avg_context_words": context_words / len(pairs),
+                    "index_bytes": index_bytes,
+                    "ingest_seconds": extract_seconds + embed_seconds + build_seconds,
+                    "query_ms": (query_embed_seconds + search_seconds) * 1000,
+                })
+
+    return results
+
+
+def recommend(results, recall_tolerance: float = 0.02):
+    """
+    Picks a configuration: among those within ``recall_tolerance`` of the
+    best recall@k, prefer the smallest context, then the best MRR, then the
+    fastest query.
+    """
+    if not results:
+        return None
+    best_recall = max(r["recall_at_k"] for r in results)
+    candidates = [r for r in results if r["recall_at_k"] >= best_recall - recall_tolerance]
+    return min(candidates, key=lambda r: (r["avg_context_words"], -r["mrr"], r["query_ms"]))
+
+
+def print_results(results, top: int = 15):
+    """Print the best configurations as a table."""
+    ranked = sorted(results, key=lambda r: (-r["recall_at_k"], -r["mrr"], r["avg_context_words"]))
+    print(f"\n{'size':>5} {'ovl':>4} {'k':>2} {'index':>6} {'recall':>7} {'mrr':>6} "
+          f"{'ctx words':>9} {'index KB':>9} {'ingest s':>9} {'query ms':>9}")
+    for r in ranked[:top]:
+        print(f"{r['chunk_size']:>5} {r['chunk_overlap']:>4} {r['k']:>2} {r['index_type']:>6} "
+              f"{r['recall_at_k']:>7.2f} {r['mrr']:>6.2f} {r['avg_context_words']:>9.0f} "
+              f"{r['index_bytes'] / 1024:>9.0f} {r['ingest_seconds']:>9.2f} {r['query_ms']:>9.2f}")
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate and tune retrieval settings.")
+    parser.add_argument("pdf", help="PDF file to evaluate on")
+    parser.add_argument("questions", help="JSON/JSONL file of {question, expected} pairs")
+    parser.add_argument("--chunk-sizes", type=_int_list, default=DEFAULT_CHUNK_SIZES)
+    parser.add_argument("--overlaps", type=_int_list, default=DEFAULT_CHUNK_OVERLAPS)
+    parser.add_argument("--ks", type=_int_list, default=DEFAULT_KS)
+    parser.add_argument("--index-types", type=lambda v: v.split(","), default=DEFAULT_INDEX_TYPES)
+    parser.add_argument("--flat", action="store_true", help="Tune flat-text extraction instead of layout-aware")
+    parser.add_argument("--threshold", type=float, default=0.8,
+                        help="Share of the expected passage the retrieved chunks must cover")
+    parser.add_argument("--save", action="store_true", help="Save the recommendation for the app")
+    args = parser.parse_args()
+
+    results = evaluate(
+        args.pdf,
+        load_questions(args.questions),
+        chunk_sizes=args.chunk_sizes,
+        chunk_overlaps=args.overlaps,
+        ks=args.ks,
+        index_types=args.index_types,
+        layout_aware=not args.flat,
+        threshold=args.threshold,
+    )
+    print_results(results)
+
+    os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok=True)
+    with open(RESULTS_PATH, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n✅ Full results saved to {RESULTS_PATH}")
+
+    best = recommend(results)
+    if best is None:
+        print("❌ No configuration could be evaluated.")
+    else:
+        print(
+            f"\n⭐ Recommended: chunk_size={best['chunk_size']} chunk_overlap={best['chunk_overlap']} "
+            f"k={best['k']} index={best['index_type']} "
+            f"extraction={'layout' if best['layout_aware'] else 'flat'} "
+            f"(recall@k {best['recall_at_k']:.2f}, MRR {best['mrr']:.2f}, "
+            f"~{best['avg_context_words']:.0f} context words, {best['query_ms']:.1f} ms/query)"
+        )
+        if args.save:
+            from app.utils import save_retrieval_config
+            save_retrieval_config(best)
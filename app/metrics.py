@@ -0,0 +1,330 @@
+# app/metrics.py
+"""
+Lightweight tracing and metrics for the RAG pipeline.
+
+Spans time each pipeline stage (PDF open, page extraction, chunking,
+embedding, FAISS search, prompt assembly, tokenization, generation) and
+record the resident memory delta across the stage. Counters track token
+counts and cache hits. Everything is exposed as Prometheus text and as one
+JSON line per query.
+
+Set ``SMART_PDF_METRICS=0`` to switch to no-op mode: ``span`` then returns a
+shared do-nothing context manager and every recorder returns immediately.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+
+ENABLED = os.getenv("SMART_PDF_METRICS", "1").lower() not in ("0", "false", "off", "no")
+QUERY_LOG_PATH = os.getenv(
+    "SMART_PDF_METRICS_LOG", os.path.join(DATA_DIR, "query_metrics.jsonl")
+)
+
+# Opt-in exporters, started by start_exporters() from the UI and CLI
+METRICS_PORT = os.getenv("SMART_PDF_METRICS_PORT")          # e.g. 9108 -> /metrics endpoint
+METRICS_HOST = os.getenv("SMART_PDF_METRICS_HOST", "127.0.0.1")
+METRICS_TEXTFILE = os.getenv("SMART_PDF_METRICS_TEXTFILE")  # rewritten after every query
+
+try:
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = 4096
+
+
+def _rss_bytes():
+    """Return the current resident set size in bytes, or 0 if unknown."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        pass
+    # Off Linux only the peak RSS (ru_maxrss) is cheaply available, which
+    # cannot give per-span deltas, so memory is reported as unknown
+    return 0
+
+
+class _NoopSpan:
+    """Shared span used when metrics are disabled."""
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """A timed pipeline stage with free-form attributes."""
+
+    def __init__(self, registry, name, attrs):
+        self.registry = registry
+        self.name = name
+        self.attrs = attrs
+        self.start = 0.0
+        self.duration = 0.0
+        self.mem_delta = 0
+        self._rss_start = 0
+
+    def set(self, **attrs):
+        """Attach extra attributes (e.g. token or chunk counts) to the span."""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self._rss_start = _rss_bytes()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        self.mem_delta = _rss_bytes() - self._rss_start
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.registry._finish_span(self)
+        return False
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "seconds": round(self.duration, 6),
+            "mem_delta_bytes": self.mem_delta,
+            **self.attrs,
+        }
+
+
+class _QueryTrace:
+    """Spans and counters collected while answering one question."""
+
+    def __init__(self, question):
+        self.question = question
+        self.started_at = time.time()
+        self.spans = []
+        self.counters = {}
+
+
+_current_query = contextvars.ContextVar("smart_pdf_current_query", default=None)
+
+
+class Metrics:
+    """
+    Process-wide metrics registry.
+
+    Args:
+        enabled (bool): When False every method is a cheap no-op.
+        query_log_path (str): File that receives one JSON line per query.
+    """
+
+    def __init__(self, enabled: bool = ENABLED, query_log_path: str = QUERY_LOG_PATH):
+        self.enabled = enabled
+        self.query_log_path = query_log_path
+        self._lock = threading.Lock()
+        self._counters = {}   # (name, labels) -> value
+        self._timings = {}    # stage name -> [count, total seconds, total mem delta]
+        self._server = None
+        self._server_started = False
+        self._textfile_path = None
+
+    # ------------------------------
+    # Recording
+    # ------------------------------
+
+    def span(self, name: str, **attrs):
+        """Return a context manager timing the stage ``name``."""
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, name, attrs)
+
+    def incr(self, name: str, value: float = 1, **labels):
+        """Increase counter ``name`` (with optional labels) by ``value``."""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        trace = _current_query.get()
+        if trace is not None:
+            label = ",".join(f"{k}={v}" for k, v in key[1])
+            trace_key = f"{name}{{{label}}}" if label else name
+            trace.counters[trace_key] = trace.counters.get(trace_key, 0) + value
+
+    def record_tokens(self, kind: str, count: int):
+        """Record ``count`` tokens of the given kind ("prompt" or "completion")."""
+        self.incr("tokens_total", count, kind=kind)
+
+    def record_cache(self, cache: str, hit: bool):
+        """Record a hit or miss for the named cache."""
+        self.incr("cache_requests_total", 1, cache=cache, result="hit" if hit else "miss")
+
+    def _finish_span(self, span):
+        with self._lock:
+            stats = self._timings.setdefault(span.name, [0, 0.0, 0])
+            stats[0] += 1
+            stats[1] += span.duration
+            stats[2] += span.mem_delta
+        trace = _current_query.get()
+        if trace is not None:
+            trace.spans.append(span.to_dict())
+
+    @contextmanager
+    def query(self, question: str):
+        """
+        Collect every span recorded while answering ``question`` and append
+        them to the per-query JSON log when the block exits.
+        """
+        if not self.enabled:
+            yield None
+            return
+        trace = _QueryTrace(question)
+        token = _current_query.set(trace)
+        try:
+            with self.span("query.total"):
+                yield trace
+        finally:
+            _current_query.reset(token)
+            self._write_query_log(trace)
+            if self._textfile_path:
+                try:
+                    self.write_prometheus(self._textfile_path)
+                except OSError as e:
+                    print(f"⚠ Could not write Prometheus textfile: {e}")
+
+    def _write_query_log(self, trace):
+        record = {
+            "timestamp": trace.started_at,
+            "question": trace.question,
+            "spans": trace.spans,
+            "counters": trace.counters,
+        }
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.query_log_path)), exist_ok=True)
+            with open(self.query_log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError as e:
+            print(f"⚠ Could not write query metrics: {e}")
+
+    # ------------------------------
+    # Export
+    # ------------------------------
+
+    def cache_hit_rate(self, cache: str):
+        """Return the hit rate of ``cache`` in [0, 1], or None if unused."""
+        hits = misses = 0
+        with self._lock:
+            for (name, labels), value in self._counters.items():
+                labels = dict(labels)
+                if name != "cache_requests_total" or labels.get("cache") != cache:
+                    continue
+                if labels.get("result") == "hit":
+                    hits += value
+                else:
+                    misses += value
+        total = hits + misses
+        return hits / total if total else None
+
+    def to_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = [
+            "# HELP smart_pdf_stage_seconds Time spent in each pipeline stage.",
+            "# TYPE smart_pdf_stage_seconds summary",
+        ]
+        with self._lock:
+            timings = sorted(self._timings.items())
+            counters = sorted(self._counters.items())
+        for stage, (count, total, _) in timings:
+            lines.append(f'smart_pdf_stage_seconds_count{{stage="{stage}"}} {count}')
+            lines.append(f'smart_pdf_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+        lines.append("# HELP smart_pdf_stage_memory_delta_bytes Resident memory change across each stage.")
+        lines.append("# TYPE smart_pdf_stage_memory_delta_bytes summary")
+        for stage, (count, _, mem) in timings:
+            lines.append(f'smart_pdf_stage_memory_delta_bytes_count{{stage="{stage}"}} {count}')
+            lines.append(f'smart_pdf_stage_memory_delta_bytes_sum{{stage="{stage}"}} {mem}')
+
+        seen = set()
+        for (name, labels), value in counters:
+            metric = f"smart_pdf_{name}"
+            if metric not in seen:
+                seen.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            label_str = ",".join(f'{k}="{v}"' for k, v in labels)
+            lines.append(f"{metric}{{{label_str}}} {value}" if label_str else f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        """Write the Prometheus text to ``path`` (e.g. for a node_exporter textfile collector)."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+    def serve_prometheus(self, port: int = 9108, host: str = "127.0.0.1"):
+        """
+        Serve ``/metrics`` on ``host:port`` from a daemon thread.
+
+        The endpoint is unauthenticated, so it binds to localhost by default.
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.to_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), _Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"✅ Metrics served at http://{host}:{port}/metrics")
+        return server
+
+    def start_exporters(self, port=METRICS_PORT, host: str = METRICS_HOST,
+                        textfile_path=METRICS_TEXTFILE):
+        """
+        Start the opt-in exporters configured through the environment.
+
+        Safe to call on every Streamlit rerun: the HTTP server is started once.
+
+        Args:
+            port: Port for the /metrics endpoint (SMART_PDF_METRICS_PORT); None disables it
+            host (str): Bind address (SMART_PDF_METRICS_HOST, default 127.0.0.1)
+            textfile_path: File rewritten after every query (SMART_PDF_METRICS_TEXTFILE)
+        """
+        if not self.enabled:
+            return
+        if textfile_path:
+            self._textfile_path = textfile_path
+        with self._lock:
+            if not port or self._server_started:
+                return
+            # Only try once, so a taken port is not retried on every rerun
+            self._server_started = True
+        try:
+            self._server = self.serve_prometheus(int(port), host)
+        except (OSError, ValueError) as e:
+            print(f"⚠ Could not start metrics endpoint on {host}:{port}: {e}")
+
+    def reset(self):
+        """Drop all recorded metrics."""
+        with self._lock:
+            self._counters.clear()
+            self._timings.clear()
+
+
+# Shared registry used by the pipeline modules
+metrics = Metrics()
@@ -1,29 +1,373 @@
-import fitz  # PyMuPDF
+import hashlib
+import multiprocessing
 import os
+import re
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from app.metrics import metrics
 
 # Path to data directory (one level up from app/)
 DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+OCR_CACHE_DIR = os.path.join(DATA_DIR, "ocr_cache")
+
+# OCR settings: higher DPI is more accurate but slower (150 fast, 300 accurate)
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+OCR_LANGUAGE = os.getenv("OCR_LANGUAGE", "eng")
+
+
+def _ocr_cache_key(doc, page_index, dpi=OCR_DPI, language=OCR_LANGUAGE):
+    """
+    Cache key for a page's OCR text, computed without rendering the page.
+
+    Hashes the page's content stream and the raw streams of the images it
+    draws (for a scan, the scanned image itself) plus the page geometry
+    and OCR settings, so the parent can look up the cache cheaply before
+    any worker starts.
+    """
+    page = doc[page_index]
+    digest = hashlib.sha256(page.read_contents())
+    for image in page.get_images(full=True):
+        digest.update(doc.xref_stream_raw(image[0]) or b"")
+    digest.update(f"{tuple(page.rect)}:{page.rotation}:{dpi}:{language}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _read_ocr_cache(key):
+    """Return the cached OCR text for ``key``, or None on a miss."""
+    try:
+        with open(os.path.join(OCR_CACHE_DIR, f"{key}.txt"), "r", encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _write_ocr_cache(key, text):
+    """Store OCR text under ``key``; failures only cost the cache."""
+    cache_path = os.path.join(OCR_CACHE_DIR, f"{key}.txt")
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(OCR_CACHE_DIR, exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"⚠ Could not cache OCR text: {e}")
+
+
+def _ocr_page(pdf_path, page_index, dpi=OCR_DPI, language=OCR_LANGUAGE):
+    """
+    OCR a single page with Tesseract through PyMuPDF.
+
+    Runs in a worker process, so it reopens the PDF itself.
+
+    Returns:
+        tuple: (page_index, text or None if OCR failed, seconds)
+    """
+    import fitz  # PyMuPDF
+
+    start = time.perf_counter()
+    try:
+        with fitz.open(pdf_path) as doc:
+            pix = doc[page_index].get_pixmap(dpi=dpi)
+        with fitz.open("pdf", pix.pdfocr_tobytes(language=language)) as ocr_doc:
+            text = ocr_doc[0].get_text()
+    except Exception as e:
+        print(f"⚠ OCR failed on page {page_index + 1}: {e}")
+        return page_index, None, time.perf_counter() - start
+    return page_index, text, time.perf_counter() - start
+
+
+def ocr_pages(pdf_path, page_indexes, dpi=OCR_DPI, language=OCR_LANGUAGE, max_workers=None):
+    """
+    OCR several pages in parallel.
+
+    Pages already in the OCR cache (data/ocr_cache/) are read in this
+    process; only the misses are sent to worker processes, so re-uploading
+    a known scan starts no pool at all.
+
+    Args:
+        pdf_path (str): Path to the PDF file
+        page_indexes (list): Zero-based indexes of the pages to OCR
+        dpi (int): Render resolution; trades accuracy for latency
+        language (str): Tesseract language code(s), e.g. "eng" or "eng+deu"
+        max_workers (int): Worker processes (defaults to the CPU count)
+    Returns:
+        dict: page index -> OCR text
+    """
+    import fitz  # PyMuPDF
+
+    if not page_indexes:
+        return {}
+
+    texts = {}
+    with metrics.span("pdf.ocr", pages=len(page_indexes), dpi=dpi) as span:
+        with fitz.open(pdf_path) as doc:
+            keys = {i: _ocr_cache_key(doc, i, dpi, language) for i in page_indexes}
+
+        misses = []
+        for page_index in page_indexes:
+            cached = _read_ocr_cache(keys[page_index])
+            metrics.record_cache("ocr", cached is not None)
+            if cached is None:
+                misses.append(page_index)
+            else:
+                texts[page_index] = cached
+        span.set(cache_misses=len(misses))
+
+        if len(misses) <= 1 or max_workers == 1:
+            results = [_ocr_page(pdf_path, i, dpi, language) for i in misses]
+        else:
+            workers = min(max_workers or os.cpu_count() or 1, len(misses))
+            # Spawn, not fork: the caller may be the multithreaded Streamlit
+            # server holding torch/tokenizers/FAISS state; workers only need fitz
+            spawn = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=spawn) as pool:
+                results = list(pool.map(
+                    _ocr_page,
+                    [pdf_path] * len(misses),
+                    misses,
+                    [dpi] * len(misses),
+                    [language] * len(misses),
+                ))
+
+    for page_index, text, seconds in results:
+        metrics.incr("ocr_seconds_total", seconds)
+        if text is None:
+            texts[page_index] = ""
+            continue
+        _write_ocr_cache(keys[page_index], text)
+        texts[page_index] = text
+    return texts
+
+
+def extract_text_from_pdf(pdf_path, ocr: bool = True, ocr_dpi: int = OCR_DPI, ocr_workers=None):
+    """
+    Extract text from a PDF file and save it into data/ folder.
+
+    Pages without a text layer (scans) are OCRed in parallel when ``ocr`` is set.
+    """
+    import fitz  # PyMuPDF
 
-def extract_text_from_pdf(pdf_path):
-    """Extract text from a PDF file and save it into data/ folder."""
     try:
         # Open PDF
-        doc = fitz.open(pdf_path)
+        with metrics.span("pdf.open") as span:
+            doc = fitz.open(pdf_path)
+            span.set(pages=len(doc))
         print(f"✅ Opened PDF: {pdf_path}")
         
+        page_texts = []
+        with metrics.span("pdf.extract"):
+            for page_num, page in enumerate(doc, start=1): #type: ignore
+                # Extract text from each page
+                with metrics.span("pdf.extract_page", page=page_num) as span:
+                    text = page.get_text()
+                    span.set(chars=len(text))
+                page_texts.append(text)
+        doc.close()
+
+        # OCR fallback for pages with no text layer
+        scanned = [i for i, text in enumerate(page_texts) if not text.strip()]
+        if ocr and scanned:
+            print(f"🔍 Running OCR on {len(scanned)} scanned page(s)...")
+            for page_index, text in ocr_pages(pdf_path, scanned, dpi=ocr_dpi, max_workers=ocr_workers).items():
+                page_texts[page_index] = text
+
         all_text = ""
-        for page_num, page in enumerate(doc, start=1): #type: ignore
-            # Extract text from each page
-            text = page.get_text()
+        for page_num, text in enumerate(page_texts, start=1):
             all_text += f"\n--- Page {page_num} ---\n{text}"
-        
-       
 
-        
         return all_text
     except Exception as e:
         print(f"❌ Error extracting text: {e}")
 
+
+# ------------------------------
+# Layout-aware extraction
+# ------------------------------
+
+BLOCK_HEADING = "heading"
+BLOCK_PARAGRAPH = "paragraph"
+BLOCK_LIST = "list"
+BLOCK_TABLE = "table"
+
+_LIST_ITEM_RE = re.compile(r"^\s*([•\-\*–▪●◦]|\(?\d{1,3}[.)]|\(?[a-zA-Z][.)])\s+")
+_BOLD_FLAG = 16
+
+
+def _overlaps(bbox, other, threshold=0.5):
+    """Return True if more than ``threshold`` of ``bbox`` lies inside ``other``."""
+    x0, y0 = max(bbox[0], other[0]), max(bbox[1], other[1])
+    x1, y1 = min(bbox[2], other[2]), min(bbox[3], other[3])
+    if x1 <= x0 or y1 <= y0:
+        return False
+    area = (bbox[2] - bbox[0]) * (bbox[3] - bbox[1])
+    return area > 0 and (x1 - x0) * (y1 - y0) / area > threshold
+
+
+def _reading_order(blocks, page_width):
+    """
+    Sort blocks so two-column layouts read column by column.
+
+    Full-width blocks (titles, wide tables) start a new band; within a band
+    the left column is read before the right one.
+    """
+    middle = page_width / 2
+    full_width_tops = sorted(
+        b["bbox"][1] for b in blocks if b["bbox"][0] < middle < b["bbox"][2]
+    )
+
+    def key(block):
+        x0, y0, x1, _ = block["bbox"]
+        band = sum(1 for top in full_width_tops if top <= y0)
+        if x0 < middle < x1:
+            column = -1
+        else:
+            column = 0 if x1 <= middle else 1
+        return (band, column, y0, x0)
+
+    return sorted(blocks, key=key)
+
+
+def _classify_text_block(lines, body_size):
+    """Classify a PyMuPDF text block as heading, list or paragraph."""
+    spans = [span for line in lines for span in line["spans"] if span["text"].strip()]
+    text = "\n".join(
+        "".join(span["text"] for span in line["spans"]).strip() for line in lines
+    ).strip()
+    if not spans or not text:
+        return None, text
+
+    max_size = max(span["size"] for span in spans)
+    all_bold = all(span["flags"] & _BOLD_FLAG for span in spans)
+    if len(text) < 200 and len(lines) <= 3 and (max_size >= body_size * 1.2 or all_bold):
+        return BLOCK_HEADING, text
+
+    line_texts = [line for line in text.splitlines() if line.strip()]
+    if len(line_texts) > 1 and sum(bool(_LIST_ITEM_RE.match(line)) for line in line_texts) > len(line_texts) / 2:
+        return BLOCK_LIST, text
+    if len(line_texts) == 1 and _LIST_ITEM_RE.match(line_texts[0]):
+        return BLOCK_LIST, text
+
+    return BLOCK_PARAGRAPH, text
+
+
+def _page_blocks(page, page_num):
+    """Extract typed blocks (tables first, then text outside tables) from one page."""
+    blocks = []
+
+    table_boxes = []
+    if hasattr(page, "find_tables"):  # PyMuPDF >= 1.23
+        for table in page.find_tables().tables:
+            rows = [[(cell or "").strip() for cell in row] for row in table.extract()]
+            rows = [row for row in rows if any(row)]
+            if not rows:
+                continue
+            # A header found above the table body is not part of extract()
+            header = getattr(table, "header", None)
+            if header is not None and header.external:
+                rows.insert(0, [(name or "").strip() for name in header.names])
+            bbox = tuple(table.bbox)
+            table_boxes.append(bbox)
+            blocks.append({
+                "type": BLOCK_TABLE,
+                "text": "\n".join(" | ".join(row) for row in rows),
+                "rows": rows,
+                "page": page_num,
+                "bbox": bbox,
+            })
+
+    text_blocks = [
+        b for b in page.get_text("dict")["blocks"]
+        if b.get("type") == 0 and not any(_overlaps(b["bbox"], box) for box in table_boxes)
+    ]
+
+    # The most common span size (weighted by characters) is the body text size
+    sizes = Counter()
+    for b in text_blocks:
+        for line in b["lines"]:
+            for span in line["spans"]:
+                sizes[round(span["size"])] += len(span["text"].strip())
+    body_size = sizes.most_common(1)[0][0] if sizes else 0
+
+    for b in text_blocks:
+        block_type, text = _classify_text_block(b["lines"], body_size)
+        if block_type is None:
+            continue
+        blocks.append({
+            "type": block_type,
+            "text": text,
+            "page": page_num,
+            "bbox": tuple(b["bbox"]),
+        })
+
+    return _reading_order(blocks, page.rect.width)
+
+
+def extract_blocks_from_pdf(pdf_path, ocr: bool = True, ocr_dpi: int = OCR_DPI, ocr_workers=None):
+    """
+    Extract typed layout blocks from a PDF.
+
+    Uses PyMuPDF block and table detection so tables stay row-aligned and
+    multi-column pages keep their reading order.
+
+    Args:
+        pdf_path (str): Path to the PDF file
+        ocr (bool): OCR pages without a text layer
+        ocr_dpi (int): Render resolution for OCR
+        ocr_workers (int): OCR worker processes
+    Returns:
+        list of dicts with "type" (heading, paragraph, list or table), "text",
+        "page", "bbox" and, for tables, "rows"
+    """
+    import fitz  # PyMuPDF
+
+    try:
+        with metrics.span("pdf.open") as span:
+            doc = fitz.open(pdf_path)
+            span.set(pages=len(doc))
+        print(f"✅ Opened PDF: {pdf_path}")
+
+        page_blocks = []
+        page_rects = []
+        with metrics.span("pdf.extract_layout"):
+            for page_num, page in enumerate(doc, start=1): #type: ignore
+                with metrics.span("pdf.layout_page", page=page_num) as span:
+                    try:
+                        blocks = _page_blocks(page, page_num)
+                    except Exception as e:
+                        # Keep the rest of the document; fall back to plain text for this page
+                        print(f"⚠ Layout extraction failed on page {page_num}: {e}")
+                        text = page.get_text().strip()
+                        blocks = [{
+                            "type": BLOCK_PARAGRAPH,
+                            "text": text,
+                            "page": page_num,
+                            "bbox": tuple(page.rect),
+                        }] if text else []
+                        span.set(fallback=True)
+                    span.set(blocks=len(blocks))
+                page_blocks.append(blocks)
+                page_rects.append(tuple(page.rect))
+        doc.close()
+
+        # Scanned pages have no blocks; OCR them into a single paragraph block
+        scanned = [i for i, blocks in enumerate(page_blocks) if not blocks]
+        if ocr and scanned:
+            print(f"🔍 Running OCR on {len(scanned)} scanned page(s)...")
+            for page_index, text in ocr_pages(pdf_path, scanned, dpi=ocr_dpi, max_workers=ocr_workers).items():
+                if text.strip():
+                    page_blocks[page_index] = [{
+                        "type": BLOCK_PARAGRAPH,
+                        "text": text.strip(),
+                        "page": page_index + 1,
+                        "bbox": page_rects[page_index],
+                    }]
+
+        return [block for blocks in page_blocks for block in blocks]
+    except Exception as e:
+        print(f"❌ Error extracting blocks: {e}")
+
 if __name__ == "__main__":
     # Change this to your test PDF path
     test_pdf = os.path.join(os.path.dirname(__file__), "..", "internship.pdf")
@@ -1,37 +1,117 @@
 import os
-import torch
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM, pipeline
-from langchain_huggingface import HuggingFaceEmbeddings, HuggingFacePipeline
-from langchain.chains import RetrievalQA
-from langchain.prompts import PromptTemplate
+from functools import lru_cache
+
+# torch, transformers and LangChain (including langchain_core) are imported
+# inside the functions that need them so importing this module (e.g. from
+# the UI) stays fast
 
 # ✅ Import helper from utils.py
-from app.utils import load_faiss_index
+from app.utils import load_faiss_index, load_retrieval_config
+from app.embedder import get_embeddings
+from app.conversation import count_tokens, fit_history, format_history, retrieve_with_history
+from app.metrics import metrics
+
+# Loaded instruction models, keyed by model name
+_model_cache = {}
+
+
+@lru_cache(maxsize=None)
+def _metrics_handler_class():
+    """Defines the callback handler on first use so langchain_core is not imported at module load."""
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class MetricsCallbackHandler(BaseCallbackHandler):
+        """Records prompt assembly, tokenization and generation spans."""
+
+        def __init__(self, tokenizer=None):
+            self.tokenizer = tokenizer
+            self._spans = {}
+
+        def _start(self, key, name, **attrs):
+            span = metrics.span(name, **attrs)
+            span.__enter__()
+            self._spans[key] = span
+
+        def _end(self, key, **attrs):
+            span = self._spans.pop(key, None)
+            if span is not None:
+                span.set(**attrs)
+                span.__exit__(None, None, None)
+
+        def _count_tokens(self, texts):
+            if self.tokenizer is None:
+                return None
+            return sum(len(self.tokenizer.encode(text)) for text in texts)
+
+        def start_prompt_assembly(self):
+            """Called once retrieval is done; the span ends when the LLM starts."""
+            self._start("prompt", "prompt.assemble")
+
+        def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+            self._end("prompt", chars=sum(len(p) for p in prompts))
+            with metrics.span("llm.tokenize") as span:
+                tokens = self._count_tokens(prompts)
+                span.set(tokens=tokens)
+            if tokens is not None:
+                metrics.record_tokens("prompt", tokens)
+            self._start(run_id, "llm.generate")
+
+        def on_llm_end(self, response, *, run_id, **kwargs):
+            texts = [gen.text for gens in response.generations for gen in gens]
+            tokens = self._count_tokens(texts)
+            if tokens is not None:
+                metrics.record_tokens("completion", tokens)
+            self._end(run_id, tokens=tokens)
+
+        def on_llm_error(self, error, *, run_id, **kwargs):
+            self._end(run_id, error=type(error).__name__)
+
+    return MetricsCallbackHandler
+
+
+def metrics_callback_handler(tokenizer=None):
+    """
+    Returns a LangChain callback handler that records prompt assembly,
+    tokenization and generation spans while a chain runs (FAISS search is
+    recorded by app.conversation.batched_search).
+
+    Args:
+        tokenizer: Optional HuggingFace tokenizer used to count tokens
+    """
+    return _metrics_handler_class()(tokenizer)
 
 
 def load_vector_store():
     """Load FAISS vector store via utils.py"""
     print("Loading FAISS index...")
 
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-MiniLM-L6-v2"
-    )
+    embeddings = get_embeddings()
 
     # ✅ Use centralized helper
     return load_faiss_index("data/faiss_index", embeddings)
 
 
 def initialize_instruction_model():
-    """Load a local instruction-tuned model"""
+    """Load a local instruction-tuned model (cached after the first call)"""
     model_name = "google/flan-t5-base"  # small and instruction tuned
 
+    cached = _model_cache.get(model_name)
+    metrics.record_cache("llm_model", cached is not None)
+    if cached is not None:
+        return cached
+
+    import torch
+    from transformers import AutoTokenizer, AutoModelForSeq2SeqLM, pipeline
+    from langchain_huggingface import HuggingFacePipeline
+
     print(f"Loading model: {model_name}")
-    tokenizer = AutoTokenizer.from_pretrained(model_name)
-    model = AutoModelForSeq2SeqLM.from_pretrained(
-        model_name,
-        torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
-        device_map="auto" if torch.cuda.is_available() else None
-    )
+    with metrics.span("llm.load", model=model_name):
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModelForSeq2SeqLM.from_pretrained(
+            model_name,
+            torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
+            device_map="auto" if torch.cuda.is_available() else None
+        )
 
     pipe = pipeline(
         "text2text-generation",
@@ -43,15 +123,24 @@ def initialize_instruction_model():
         device=0 if torch.cuda.is_available() else -1
     )
 
-    return HuggingFacePipeline(pipeline=pipe)
+    llm = HuggingFacePipeline(pipeline=pipe)
+    _model_cache[model_name] = llm
+    return llm
 
 
-def create_qa_chain(vector_store, llm):
-    """Create Retrieval QA chain with custom prompt"""
+def create_qa_chain(vector_store, llm, k: int = 3):
+    """Create Retrieval QA chain with custom prompt, retrieving ``k`` chunks"""
+    from langchain.chains import RetrievalQA
+    from langchain.prompts import PromptTemplate
+
     prompt_template = """
-You are a helpful assistant. Use the provided context to answer the question concisely.
+You are a helpful assistant. Use the provided context and the conversation so far
+to answer the question concisely.
 If the answer is not in the context, say "I don't know".
 
+Conversation so far:
+{history}
+
 Context:
 {context}
 
@@ -59,35 +148,160 @@ Question: {question}
 
 Answer:
 """
+    # "history" is filled in by answer_conversational, so the chain is run
+    # through it (or answer_question) rather than qa_chain.invoke
     prompt = PromptTemplate(
         template=prompt_template,
-        input_variables=["context", "question"]
+        input_variables=["history", "context", "question"]
     )
 
     return RetrievalQA.from_chain_type(
         llm=llm,
         chain_type="stuff",
-        retriever=vector_store.as_retriever(search_kwargs={"k": 3}),
+        retriever=vector_store.as_retriever(search_kwargs={"k": k}),
         chain_type_kwargs={"prompt": prompt},
         return_source_documents=True
     )
 
 
+def answer_question(qa_chain, question: str):
+    """
+    Run one question, without chat history, through the QA chain with per-stage metrics.
+
+    Args:
+        qa_chain: Chain returned by create_qa_chain
+        question (str): User question
+    Returns:
+        dict: Chain result with "result" and "source_documents"
+    """
+    retriever = qa_chain.retriever
+    return answer_conversational(
+        qa_chain,
+        retriever.vectorstore,
+        question,
+        [],
+        multi_query=False,
+        k=retriever.search_kwargs.get("k", 3),
+    )
+
+
+def _get_llm(qa_chain):
+    llm_chain = getattr(getattr(qa_chain, "combine_documents_chain", None), "llm_chain", None)
+    return getattr(llm_chain, "llm", None)
+
+
+def _get_tokenizer(qa_chain):
+    pipe = getattr(_get_llm(qa_chain), "pipeline", None)
+    return getattr(pipe, "tokenizer", None)
+
+
+def _prompt_history_budget(qa_chain, tokenizer, documents, question, max_history_tokens):
+    """
+    Tokens left for the conversation once the template, context and question
+    are in the prompt, capped at ``max_history_tokens``.
+
+    The HF pipeline does not truncate its input, so the prompt has to fit the
+    model's limit (512 tokens for flan-t5-base).
+    """
+    model_max = getattr(tokenizer, "model_max_length", None)
+    # Tokenizers without a configured limit report a huge sentinel value
+    if tokenizer is None or not model_max or model_max > 100_000:
+        return max_history_tokens
+
+    combine_chain = qa_chain.combine_documents_chain
+    separator = getattr(combine_chain, "document_separator", "\n\n")
+    context = separator.join(doc.page_content for doc in documents)
+    base_prompt = combine_chain.llm_chain.prompt.format(history="(none)", context=context, question=question)
+    return max(0, min(max_history_tokens, model_max - count_tokens(base_prompt, tokenizer)))
+
+
+def answer_conversational(qa_chain, vector_store, question: str, history,
+                          multi_query: bool = True, condense_with_llm: bool = False,
+                          k: int = 3, max_history_tokens: int = 128):
+    """
+    Answer a follow-up question using the chat history.
+
+    The history is trimmed to a token budget, folded into a standalone
+    query for retrieval and passed to the prompt so the model can resolve
+    references like "the second one". The prompt gets only as much history
+    as still fits the model's input limit after the template, context and
+    question. With ``multi_query`` several variants are embedded in one batch
+    and searched with one FAISS call, then fused. Only the final answer
+    needs a model call unless ``condense_with_llm`` is set.
+
+    Args:
+        qa_chain: Chain returned by create_qa_chain
+        vector_store: FAISS vector store the chain was built on
+        question (str): User question
+        history (list): (question, answer) tuples, oldest first
+        multi_query (bool): Search several query variants and fuse them
+        condense_with_llm (bool): Rewrite the question with the LLM first
+        k (int): Number of documents passed to the LLM
+        max_history_tokens (int): Token budget for the history. Kept small
+            because flan-t5-base takes only 512 input tokens in total
+    Returns:
+        dict: "result", "source_documents" and "standalone_question"
+    """
+    tokenizer = _get_tokenizer(qa_chain)
+    handler = metrics_callback_handler(tokenizer) if metrics.enabled else None
+    config = {"callbacks": [handler]} if handler is not None else {}
+
+    with metrics.query(question):
+        standalone, documents, recent = retrieve_with_history(
+            vector_store,
+            question,
+            history,
+            k=k,
+            multi_query=multi_query,
+            max_history_tokens=max_history_tokens,
+            tokenizer=tokenizer,
+            llm=_get_llm(qa_chain) if condense_with_llm else None,
+        )
+        if handler is not None:
+            handler.start_prompt_assembly()
+
+        # The heuristic standalone query is only good for search; the prompt
+        # gets the question as asked plus the trimmed conversation
+        prompt_question = standalone if condense_with_llm else question
+        history_budget = _prompt_history_budget(
+            qa_chain, tokenizer, documents, prompt_question, max_history_tokens
+        )
+        prompt_history = fit_history(recent, history_budget, tokenizer)
+        output = qa_chain.combine_documents_chain.invoke(
+            {
+                "input_documents": documents,
+                "question": prompt_question,
+                "history": format_history(prompt_history) or "(none)",
+            },
+            config=config
+        )
+
+    return {
+        "result": output[qa_chain.combine_documents_chain.output_key],
+        "source_documents": documents,
+        "standalone_question": standalone,
+    }
+
+
 def get_qa_chain():
+    metrics.start_exporters()
+    config = load_retrieval_config()
     vector_store = load_vector_store()
     llm = initialize_instruction_model()
-    qa_chain = create_qa_chain(vector_store, llm)
+    qa_chain = create_qa_chain(vector_store, llm, k=config["k"])
 
     print("\n✅ Smart PDF Chatbot is ready!")
     print("Ask questions about your document. Type 'exit' to quit.\n")
 
+    history = []
     while True:
         question = input("Ask a question: ").strip()
         if question.lower() == "exit":
             print("Goodbye!")
             break
 
-        result = qa_chain.invoke({"query": question})
+        result = answer_conversational(qa_chain, vector_store, question, history, k=config["k"])
+        history.append((question, result["result"]))
 
         print(f"\nAnswer: {result['result']}\n")
 
@@ -0,0 +1,108 @@
+# app/startup_profile.py
+"""
+Import-time profile and cold-start benchmark for the CLI and UI entry points.
+
+Run from the project root:
+    python -m app.startup_profile                  # profile + benchmark defaults
+    python -m app.startup_profile ui.index 10      # one module, 10 runs
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DEFAULT_MODULES = ["app.qa_chain", "app.embedder", "ui.index"]
+
+
+def _run_import(module: str, *flags):
+    """Import ``module`` in a fresh interpreter and return the finished process."""
+    return subprocess.run(
+        [sys.executable, *flags, "-c", f"import {module}"],
+        cwd=ROOT_DIR,
+        capture_output=True,
+        text=True,
+    )
+
+
+def profile_imports(module: str, top: int = 15):
+    """
+    Profiles the imports triggered by ``module`` using ``python -X importtime``.
+
+    Args:
+        module (str): Dotted module name to import
+        top (int): Number of slowest imports to return
+    Returns:
+        list of (cumulative_ms, self_ms, package) sorted slowest first
+    """
+    result = _run_import(module, "-X", "importtime")
+    if result.returncode != 0:
+        last_line = result.stderr.strip().splitlines()[-1:] or ["unknown error"]
+        raise RuntimeError(f"❌ Failed to import {module}: {last_line[0]}")
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, package = line[len("import time:"):].split("|", 2)
+        rows.append((int(cumulative_us) / 1000, int(self_us) / 1000, package.strip()))
+
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def benchmark_startup(module: str, runs: int = 5):
+    """
+    Measures cold-start import time of ``module`` over several fresh interpreters.
+
+    Args:
+        module (str): Dotted module name to import
+        runs (int): Number of fresh interpreters to start
+    Returns:
+        dict with min, median and max wall-clock seconds
+    """
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = _run_import(module)
+        timings.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            raise RuntimeError(f"❌ Failed to import {module}")
+    return {
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "max": max(timings),
+    }
+
+
+def print_report(modules, runs: int = 5):
+    """Print the import profile and startup benchmark for each module."""
+    baseline = benchmark_startup("sys", runs)["median"]
+    print(f"Interpreter startup baseline: {baseline * 1000:.0f} ms\n")
+
+    for module in modules:
+        print(f"=== {module} ===")
+        try:
+            rows = profile_imports(module)
+            stats = benchmark_startup(module, runs)
+        except RuntimeError as e:
+            print(f"{e}\n")
+            continue
+
+        print(f"{'cumulative ms':>14} {'self ms':>9}  package")
+        for cumulative_ms, self_ms, package in rows:
+            print(f"{cumulative_ms:14.1f} {self_ms:9.1f}  {package}")
+        print(
+            f"\nCold start over {runs} runs: "
+            f"min {stats['min'] * 1000:.0f} ms, "
+            f"median {stats['median'] * 1000:.0f} ms, "
+            f"max {stats['max'] * 1000:.0f} ms "
+            f"(+{(stats['median'] - baseline) * 1000:.0f} ms over bare interpreter)\n"
+        )
+
+
+if __name__ == "__main__":
+    modules = sys.argv[1:2] or DEFAULT_MODULES
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    print_report(modules, runs)
@@ -1,5 +1,8 @@
-from langchain.text_splitter import RecursiveCharacterTextSplitter #type: ignore
 import os
+from app.metrics import metrics
+
+# Smallest body budget left after a section heading prefix
+MIN_CHUNK_BODY = 100
 
 def split_text(text, chunk_size: int = 500, chunk_overlap: int = 50):
     """
@@ -13,16 +16,138 @@ def split_text(text, chunk_size: int = 500, chunk_overlap: int = 50):
     """
     
     
+    from langchain.text_splitter import RecursiveCharacterTextSplitter #type: ignore
+
     # Split into chunks
     splitter = RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap
     )
-    chunks = splitter.split_text(text)
+    with metrics.span("chunking", chunk_size=chunk_size, chunk_overlap=chunk_overlap) as span:
+        chunks = splitter.split_text(text)
+        span.set(chunks=len(chunks))
     
     return chunks
 
 
+def _format_table_row(header, row):
+    """Render a table row as "column: value" pairs so it reads on its own."""
+    if not header or len(header) != len(row):
+        return " | ".join(row)
+    return "; ".join(f"{name}: {value}" if name else value for name, value in zip(header, row) if value)
+
+
+def split_table_rows(rows, chunk_size: int = 500):
+    """
+    Groups table rows into chunks of up to ``chunk_size`` characters.
+
+    The first row is the header; every other row is rendered as
+    "column: value" pairs. Rows are never cut, so a single row longer than
+    ``chunk_size`` becomes its own chunk.
+
+    Args:
+        rows (list): Table rows (lists of cell strings), header first
+        chunk_size (int): Max characters per chunk.
+    Returns:
+        list of chunk strings
+    """
+    header, *body = rows
+    lines = [_format_table_row(header, row) for row in body] or [" | ".join(header)]
+
+    chunks = []
+    group, size = [], 0
+    for line in lines:
+        if group and size + len(line) > chunk_size:
+            chunks.append("\n".join(group))
+            group, size = [], 0
+        group.append(line)
+        size += len(line) + 1
+    chunks.append("\n".join(group))
+    return chunks
+
+
+def split_blocks(blocks, chunk_size: int = 500, chunk_overlap: int = 50):
+    """
+    Splits typed layout blocks into retrievable chunks with metadata.
+
+    Tables and lists become their own chunks; tables are cut only between
+    rows and every table chunk repeats the section heading. Consecutive
+    paragraphs in the same section and page are merged up to ``chunk_size``.
+    The heading prefix counts towards ``chunk_size``; the body always gets
+    at least ``MIN_CHUNK_BODY`` characters, even under a very long heading.
+
+    Args:
+        blocks (list): Blocks from pdf_handler.extract_blocks_from_pdf
+        chunk_size (int): Max characters per chunk.
+        chunk_overlap (int): Overlap between paragraph chunks.
+    Returns:
+        list of (text, metadata) tuples; metadata holds page, type, bbox and section
+    """
+    chunks = []
+    section = ""
+    buffer = []  # pending paragraph blocks of the current section and page
+    splitters = {}  # body size -> text splitter
+
+    def prefix():
+        return f"{section}\n" if section else ""
+
+    def body_size():
+        return max(MIN_CHUNK_BODY, chunk_size - len(prefix()))
+
+    def split(text):
+        size = body_size()
+        if size not in splitters:
+            from langchain.text_splitter import RecursiveCharacterTextSplitter #type: ignore
+            splitters[size] = RecursiveCharacterTextSplitter(
+                chunk_size=size,
+                chunk_overlap=min(chunk_overlap, size // 2)
+            )
+        return splitters[size].split_text(text)
+
+    def emit(text, block_type, page, bbox):
+        chunks.append((prefix() + text, {
+            "page": page,
+            "type": block_type,
+            "bbox": list(bbox),
+            "section": section,
+        }))
+
+    def flush():
+        if not buffer:
+            return
+        text = "\n\n".join(block["text"] for block in buffer)
+        bbox = (
+            min(b["bbox"][0] for b in buffer), min(b["bbox"][1] for b in buffer),
+            max(b["bbox"][2] for b in buffer), max(b["bbox"][3] for b in buffer),
+        )
+        for piece in split(text):
+            emit(piece, "paragraph", buffer[0]["page"], bbox)
+        buffer.clear()
+
+    with metrics.span("chunking.blocks", blocks=len(blocks), chunk_size=chunk_size) as span:
+        for block in blocks:
+            block_type = block["type"]
+            if block_type == "paragraph":
+                if buffer and buffer[0]["page"] != block["page"]:
+                    flush()
+                buffer.append(block)
+                continue
+
+            flush()
+            if block_type == "heading":
+                section = block["text"].replace("\n", " ")
+            elif block_type == "table":
+                for piece in split_table_rows(block["rows"], body_size()):
+                    emit(piece, "table", block["page"], block["bbox"])
+            else:
+                for piece in split(block["text"]):
+                    emit(piece, block_type, block["page"], block["bbox"])
+        flush()
+        span.set(chunks=len(chunks))
+
+    return chunks
+
+
 if __name__ == "__main__":
     input_file = "data/pdf_text.txt"
     output_file = "data/chunks.txt"
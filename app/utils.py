@@ -1,5 +1,9 @@
 # app/utils.py
-from langchain_community.vectorstores import FAISS
+import json
+import os
+
+RETRIEVAL_CONFIG_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "retrieval_config.json")
+DEFAULT_RETRIEVAL_CONFIG = {"chunk_size": 500, "chunk_overlap": 50, "k": 3, "layout_aware": True}
 
 def save_faiss_index(vector_store, index_path: str):
     """
@@ -23,6 +27,8 @@ def load_faiss_index(index_path: str, embeddings=None):
     Returns:
         FAISS vectorstore object
     """
+    from langchain_community.vectorstores import FAISS
+
     try:
         vector_store = FAISS.load_local(
             index_path,
@@ -33,3 +39,51 @@ def load_faiss_index(index_path: str, embeddings=None):
         return vector_store
     except Exception as e:
         raise RuntimeError(f"❌ Failed to load FAISS index: {e}")
+
+
+def load_retrieval_config(config_path: str = RETRIEVAL_CONFIG_PATH):
+    """
+    Loads chunking and retrieval settings, e.g. as recommended by app.evaluate.
+    
+    Args:
+        config_path (str): JSON file with chunk_size, chunk_overlap, k and layout_aware
+    Returns:
+        dict: Settings, falling back to the defaults for missing keys and
+        for an unreadable or malformed file
+    """
+    config = dict(DEFAULT_RETRIEVAL_CONFIG)
+    if not os.path.exists(config_path):
+        return config
+
+    try:
+        with open(config_path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        if not isinstance(saved, dict):
+            raise ValueError("expected a JSON object")
+        for key, default in DEFAULT_RETRIEVAL_CONFIG.items():
+            # bool is an int subclass, so compare the exact types
+            if key in saved and type(saved[key]) is not type(default):
+                raise ValueError(f"{key} should be {type(default).__name__}")
+    except (OSError, ValueError) as e:
+        print(f"⚠ Ignoring retrieval config {config_path}: {e}")
+        return config
+
+    config.update({key: saved[key] for key in DEFAULT_RETRIEVAL_CONFIG if key in saved})
+    # Configs saved before layout_aware was recorded were tuned on flat text
+    if "layout_aware" not in saved:
+        config["layout_aware"] = False
+    return config
+
+
+def save_retrieval_config(config, config_path: str = RETRIEVAL_CONFIG_PATH):
+    """
+    Saves chunking and retrieval settings for the app to pick up.
+    
+    Args:
+        config (dict): Settings with chunk_size, chunk_overlap, k and layout_aware (extra keys are kept)
+        config_path (str): Destination JSON file
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(config_path)), exist_ok=True)
+    with open(config_path, "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+    print(f"✅ Retrieval config saved at {config_path}")
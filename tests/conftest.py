@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Add project root so tests can import "app"
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
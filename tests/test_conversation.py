@@ -0,0 +1,100 @@
+from app.conversation import (
+    count_tokens,
+    expand_queries,
+    reciprocal_rank_fusion,
+    trim_history,
+)
+
+
+class FakeTokenizer:
+    """Subword-like tokenizer: every 3 characters are one token."""
+
+    def encode(self, text, add_special_tokens=True):
+        return [text[i:i + 3] for i in range(0, len(text), 3)]
+
+    def decode(self, ids, skip_special_tokens=False):
+        return "".join(ids)
+
+
+class Doc:
+    def __init__(self, page_content):
+        self.page_content = page_content
+
+
+def _history_cost(history, tokenizer=None):
+    return sum(count_tokens(q, tokenizer) + count_tokens(a, tokenizer) for q, a in history)
+
+
+def test_trim_history_keeps_most_recent_turns_within_budget():
+    # Each turn costs 20 whitespace tokens
+    history = [("q1 " * 10, "a1 " * 10), ("q2 " * 10, "a2 " * 10), ("q3 " * 10, "a3 " * 10)]
+
+    kept = trim_history(history, max_tokens=45)
+
+    assert kept == history[-2:]
+    assert _history_cost(kept) == 40
+
+
+def test_trim_history_cuts_an_oversized_question():
+    question = " ".join(f"word{i}" for i in range(100))
+
+    kept = trim_history([(question, "short answer")], max_tokens=50)
+
+    assert len(kept) == 1
+    assert count_tokens(kept[0][0]) == 50
+    assert kept[0][1] == ""
+    assert _history_cost(kept) <= 50
+
+
+def test_trim_history_uses_the_tokenizer_for_truncation():
+    tokenizer = FakeTokenizer()
+    answer = "antidisestablishmentarianism " * 20
+
+    kept = trim_history([("why?", answer)], max_tokens=30, tokenizer=tokenizer)
+
+    assert kept[0][0] == "why?"
+    assert _history_cost(kept, tokenizer) <= 30
+    assert count_tokens(kept[0][1], tokenizer) == 30 - count_tokens("why?", tokenizer)
+
+
+def test_expand_queries_deduplicates_and_puts_standalone_first():
+    queries = expand_queries("the second one?", "the second one?", [("list the plans", "basic and pro")])
+
+    assert queries == [
+        "the second one?",
+        "list the plans the second one?",
+    ]
+
+
+def test_reciprocal_rank_fusion_rewards_documents_found_by_several_queries():
+    a, b, c = Doc("a"), Doc("b"), Doc("c")
+    result_lists = [
+        [(a, 0.1), (b, 0.2), (c, 0.3)],
+        [(b, 0.1), (c, 0.2)],
+        [(c, 0.1), (b, 0.2)],
+    ]
+
+    fused = reciprocal_rank_fusion(result_lists, top_n=3)
+
+    assert [doc.page_content for doc in fused] == ["b", "c", "a"]
+
+
+def test_reciprocal_rank_fusion_respects_top_n():
+    docs = [Doc(str(i)) for i in range(5)]
+
+    fused = reciprocal_rank_fusion([[(doc, 0.0) for doc in docs]], top_n=2)
+
+    assert [doc.page_content for doc in fused] == ["0", "1"]
+
+
+def test_fit_history_counts_the_speaker_labels():
+    from app.conversation import fit_history, format_history
+
+    tokenizer = FakeTokenizer()
+    history = [("first question", "first answer"), ("second question", "second answer")]
+
+    for budget in (0, 5, 12, 20, 40):
+        kept = fit_history(history, budget, tokenizer)
+        assert count_tokens(format_history(kept), tokenizer) <= budget
+    assert fit_history(history, 0, tokenizer) == []
+    assert fit_history(history, 1000, tokenizer) == history
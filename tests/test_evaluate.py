@@ -0,0 +1,88 @@
+import json
+
+import pytest
+
+from app.evaluate import is_relevant, load_questions, recommend
+from app.utils import DEFAULT_RETRIEVAL_CONFIG, load_retrieval_config
+
+
+def _result(**overrides):
+    result = {
+        "chunk_size": 500, "chunk_overlap": 50, "k": 3, "index_type": "flat",
+        "layout_aware": True, "recall_at_k": 0.9, "mrr": 0.7,
+        "avg_context_words": 200, "query_ms": 3.0,
+    }
+    result.update(overrides)
+    return result
+
+
+def test_load_questions_rejects_empty_input(tmp_path):
+    for content in ("[]", ""):
+        path = tmp_path / "questions.json"
+        path.write_text(content)
+        with pytest.raises(ValueError, match="No question"):
+            load_questions(str(path))
+
+
+def test_load_questions_reads_jsonl(tmp_path):
+    path = tmp_path / "questions.jsonl"
+    path.write_text('{"question": "q1", "expected": "e1"}\n\n{"question": "q2", "expected": "e2"}\n')
+
+    assert [pair["question"] for pair in load_questions(str(path))] == ["q1", "q2"]
+
+
+def test_is_relevant():
+    expected = "The monthly fee for the basic plan is ten dollars"
+
+    assert is_relevant("Fees\nThe monthly fee for the basic plan is ten dollars.", expected)
+    # A fragment of the passage does not cover it
+    assert not is_relevant("monthly fee for the basic plan", expected)
+    # Nor does another row that shares most of the wording
+    assert not is_relevant("The monthly fee for the pro plan is twenty dollars", expected)
+    assert not is_relevant("--- Page 3 --- the plan", expected)
+    assert not is_relevant("", expected)
+    # A passage split across retrieved chunks counts once they are joined
+    assert is_relevant("The monthly fee for the basic\nplan is ten dollars", expected)
+
+
+def test_recommend_prefers_smaller_context_within_recall_tolerance():
+    best_recall = _result(recall_at_k=0.90, avg_context_words=400)
+    cheaper = _result(recall_at_k=0.89, avg_context_words=150, chunk_size=300)
+    too_low = _result(recall_at_k=0.70, avg_context_words=50, k=1)
+
+    assert recommend([best_recall, cheaper, too_low]) is cheaper
+
+
+def test_recommend_breaks_ties_on_mrr_then_latency():
+    slow_high_mrr = _result(mrr=0.8, query_ms=9.0, index_type="flat")
+    fast_low_mrr = _result(mrr=0.6, query_ms=1.0, index_type="hnsw")
+    fast_high_mrr = _result(mrr=0.8, query_ms=2.0, index_type="ivf")
+
+    assert recommend([slow_high_mrr, fast_low_mrr, fast_high_mrr]) is fast_high_mrr
+    assert recommend([]) is None
+
+
+def test_load_retrieval_config_records_extraction_mode(tmp_path):
+    path = tmp_path / "retrieval_config.json"
+    assert load_retrieval_config(str(path))["layout_aware"] is True
+
+    path.write_text(json.dumps({"chunk_size": 300, "chunk_overlap": 0, "k": 5}))
+    legacy = load_retrieval_config(str(path))
+    assert legacy["chunk_size"] == 300
+    assert legacy["layout_aware"] is False
+
+    path.write_text(json.dumps({"chunk_size": 800, "layout_aware": True}))
+    assert load_retrieval_config(str(path))["layout_aware"] is True
+
+
+def test_load_retrieval_config_ignores_a_malformed_file(tmp_path):
+    path = tmp_path / "retrieval_config.json"
+
+    path.write_text("{not json", encoding="utf-8")
+    assert load_retrieval_config(str(path)) == DEFAULT_RETRIEVAL_CONFIG
+
+    path.write_text(json.dumps({"chunk_size": "500", "k": 5}), encoding="utf-8")
+    assert load_retrieval_config(str(path)) == DEFAULT_RETRIEVAL_CONFIG
+
+    path.write_text(json.dumps([1, 2]), encoding="utf-8")
+    assert load_retrieval_config(str(path)) == DEFAULT_RETRIEVAL_CONFIG
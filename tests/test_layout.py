@@ -0,0 +1,78 @@
+from app.pdf_handler import (
+    BLOCK_HEADING,
+    BLOCK_LIST,
+    BLOCK_PARAGRAPH,
+    _classify_text_block,
+    _reading_order,
+)
+from app.text_splitter import split_blocks, split_table_rows
+
+
+def _line(text, size=10, flags=0):
+    return {"spans": [{"text": text, "size": size, "flags": flags}]}
+
+
+def test_split_table_rows_never_cuts_a_row():
+    rows = [["Plan", "Price"], ["Basic", "10"], ["Pro", "20"], ["Enterprise", "30"]]
+
+    chunks = split_table_rows(rows, chunk_size=50)
+
+    assert chunks == [
+        "Plan: Basic; Price: 10\nPlan: Pro; Price: 20",
+        "Plan: Enterprise; Price: 30",
+    ]
+
+
+def test_split_table_rows_keeps_an_oversized_row_whole():
+    rows = [["Name", "Notes"], ["A", "x" * 100], ["B", "short"]]
+
+    chunks = split_table_rows(rows, chunk_size=20)
+
+    assert chunks == ["Name: A; Notes: " + "x" * 100, "Name: B; Notes: short"]
+
+
+def test_split_table_rows_header_only_table():
+    assert split_table_rows([["Plan", "Price"]]) == ["Plan | Price"]
+
+
+def test_split_blocks_counts_the_heading_in_chunk_size():
+    rows = [["Plan", "Price"]] + [[f"Plan {i}", str(i * 10)] for i in range(20)]
+    blocks = [
+        {"type": "heading", "text": "Monthly fees for all plans", "page": 1, "bbox": (0, 0, 100, 10)},
+        {"type": "table", "rows": rows, "page": 1, "bbox": (0, 20, 100, 200)},
+    ]
+
+    chunks = split_blocks(blocks, chunk_size=200)
+
+    assert len(chunks) > 1
+    for text, metadata in chunks:
+        assert text.startswith("Monthly fees for all plans\n")
+        assert len(text) <= 200
+        assert metadata["section"] == "Monthly fees for all plans"
+
+
+def test_classify_text_block():
+    assert _classify_text_block([_line("Fees", size=16)], 10)[0] == BLOCK_HEADING
+    assert _classify_text_block([_line("Fees", flags=16)], 10)[0] == BLOCK_HEADING
+    assert _classify_text_block([_line("• first"), _line("• second")], 10)[0] == BLOCK_LIST
+    assert _classify_text_block([_line("1. first"), _line("2. second")], 10)[0] == BLOCK_LIST
+    assert _classify_text_block(
+        [_line("The fee is charged monthly."), _line("It covers all plans.")], 10
+    )[0] == BLOCK_PARAGRAPH
+    assert _classify_text_block([_line("   ")], 10)[0] is None
+
+
+def test_reading_order_reads_left_column_before_right():
+    def block(name, bbox):
+        return {"text": name, "bbox": bbox}
+
+    blocks = [
+        block("right top", (320, 100, 580, 200)),
+        block("left bottom", (20, 300, 280, 400)),
+        block("title", (20, 20, 580, 60)),
+        block("left top", (20, 100, 280, 200)),
+    ]
+
+    ordered = _reading_order(blocks, page_width=600)
+
+    assert [b["text"] for b in ordered] == ["title", "left top", "left bottom", "right top"]
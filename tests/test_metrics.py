@@ -0,0 +1,93 @@
+import json
+
+from app.metrics import Metrics
+
+
+def test_prometheus_renders_stage_summaries_and_counters(tmp_path):
+    registry = Metrics(enabled=True, query_log_path=str(tmp_path / "q.jsonl"))
+    with registry.span("chunking"):
+        pass
+    with registry.span("chunking"):
+        pass
+    registry.record_tokens("prompt", 7)
+
+    text = registry.to_prometheus()
+
+    assert 'smart_pdf_stage_seconds_count{stage="chunking"} 2' in text
+    assert 'smart_pdf_stage_memory_delta_bytes_count{stage="chunking"} 2' in text
+    assert 'smart_pdf_stage_memory_delta_bytes_sum{stage="chunking"}' in text
+    assert "# TYPE smart_pdf_tokens_total counter" in text
+    assert 'smart_pdf_tokens_total{kind="prompt"} 7' in text
+
+
+def test_cache_hit_rate():
+    registry = Metrics(enabled=True)
+    assert registry.cache_hit_rate("ocr") is None
+
+    registry.record_cache("ocr", True)
+    registry.record_cache("ocr", True)
+    registry.record_cache("ocr", False)
+    registry.record_cache("llm_model", False)
+
+    assert registry.cache_hit_rate("ocr") == 2 / 3
+
+
+def test_query_writes_one_json_line_with_its_spans(tmp_path):
+    log_path = tmp_path / "q.jsonl"
+    registry = Metrics(enabled=True, query_log_path=str(log_path))
+
+    with registry.query("what is the fee?"):
+        with registry.span("retrieval.faiss_search", k=3):
+            pass
+        registry.record_tokens("completion", 4)
+    with registry.span("outside.query"):
+        pass
+
+    records = [json.loads(line) for line in log_path.read_text().splitlines()]
+    assert len(records) == 1
+    names = [span["name"] for span in records[0]["spans"]]
+    assert names == ["retrieval.faiss_search", "query.total"]
+    assert records[0]["spans"][0]["k"] == 3
+    assert records[0]["counters"] == {"tokens_total{kind=completion}": 4}
+
+
+def test_disabled_registry_records_nothing(tmp_path):
+    log_path = tmp_path / "q.jsonl"
+    registry = Metrics(enabled=False, query_log_path=str(log_path))
+
+    with registry.query("q"):
+        with registry.span("chunking") as span:
+            span.set(chunks=3)
+        registry.record_cache("ocr", True)
+
+    assert registry.span("a") is registry.span("b")
+    assert "stage=" not in registry.to_prometheus()
+    assert not log_path.exists()
+
+
+def test_textfile_exporter_is_rewritten_after_each_query(tmp_path):
+    textfile = tmp_path / "smart_pdf.prom"
+    registry = Metrics(enabled=True, query_log_path=str(tmp_path / "q.jsonl"))
+    registry.start_exporters(port=None, textfile_path=str(textfile))
+
+    with registry.query("q"):
+        registry.record_tokens("prompt", 3)
+
+    assert 'smart_pdf_tokens_total{kind="prompt"} 3' in textfile.read_text()
+
+
+def test_http_exporter_binds_localhost_once():
+    import urllib.request
+
+    registry = Metrics(enabled=True)
+    registry.start_exporters(port=0, textfile_path=None)
+    assert registry._server is None  # port 0 / unset means disabled
+
+    server = registry.serve_prometheus(port=0)
+    try:
+        host, port = server.server_address
+        assert host == "127.0.0.1"
+        body = urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics").read().decode()
+        assert "smart_pdf_stage_seconds" in body
+    finally:
+        server.shutdown()
@@ -1,8 +1,6 @@
 import streamlit as st
 import os
 import tempfile
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain.docstore.document import Document
 
 # Import your backend modules
 import os
@@ -11,12 +9,13 @@ import sys
 # Add parent directory so Python can find "app"
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-# Now imports will work
-from app.pdf_handler import extract_text_from_pdf
-from app.text_splitter import split_text
-from app.utils import save_faiss_index, load_faiss_index
-from app.qa_chain import create_qa_chain, initialize_instruction_model
-from app.embedder import create_faiss_index
+# Now imports will work (heavy ML libraries are only loaded on first use)
+from app.pdf_handler import extract_text_from_pdf, extract_blocks_from_pdf, OCR_DPI
+from app.text_splitter import split_text, split_blocks
+from app.utils import save_faiss_index, load_faiss_index, load_retrieval_config, DEFAULT_RETRIEVAL_CONFIG
+from app.qa_chain import create_qa_chain, initialize_instruction_model, answer_conversational
+from app.embedder import create_faiss_index, get_embeddings, traced_embeddings
+from app.metrics import metrics
 
 # ------------------------------
 # Streamlit Configuration
@@ -28,24 +27,32 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Opt-in Prometheus endpoint / textfile (started once, not on every rerun)
+metrics.start_exporters()
+
 # ------------------------------
 # Helper Functions
 # ------------------------------
 
-def create_faiss_from_chunks(chunks, index_path="data/faiss_index"):
-    """Create FAISS index directly from text chunks"""
+def create_faiss_from_chunks(chunks, index_path="data/faiss_index", metadatas=None):
+    """Create FAISS index directly from text chunks (with optional per-chunk metadata)"""
+    from langchain_community.vectorstores import FAISS
+    from langchain.docstore.document import Document
+
     try:
         # Convert chunks to Document objects
-        documents = [Document(page_content=chunk) for chunk in chunks if chunk.strip()]
+        metadatas = metadatas or [{}] * len(chunks)
+        documents = [
+            Document(page_content=chunk, metadata=metadata)
+            for chunk, metadata in zip(chunks, metadatas) if chunk.strip()
+        ]
         
-        # Initialize embeddings
-        embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2"
-        )
+        # Initialize embeddings (loaded once, then reused across reruns)
+        embeddings = get_embeddings()
         
         # Create FAISS index
-        from langchain_community.vectorstores import FAISS
-        vector_store = FAISS.from_documents(documents, embeddings)
+        with metrics.span("faiss.build", documents=len(documents)):
+            vector_store = FAISS.from_documents(documents, traced_embeddings(embeddings))
         
         # Ensure data directory exists
         os.makedirs(os.path.dirname(index_path), exist_ok=True)
@@ -68,6 +75,9 @@ def initialize_session_state():
         st.session_state.chat_history = []
     if 'pdf_processed' not in st.session_state:
         st.session_state.pdf_processed = False
+    if 'retrieval_config' not in st.session_state:
+        # Read once per session; replaced by the settings a PDF was indexed with
+        st.session_state.retrieval_config = load_retrieval_config()
 
 # ------------------------------
 # Main Streamlit App
@@ -95,17 +105,50 @@ def main():
         if uploaded_pdf is not None:
             st.success(f"✅ File uploaded: {uploaded_pdf.name}")
             
+            # OCR resolution for scanned pages
+            ocr_dpi = st.select_slider(
+                "OCR quality (DPI)",
+                options=[150, 200, 300],
+                value=OCR_DPI if OCR_DPI in (150, 200, 300) else 200,
+                help="Used only for scanned pages. Higher is more accurate but slower."
+            )
+            
+            # Table/column-aware extraction (defaults to the mode the saved config was tuned on)
+            layout_aware = st.toggle(
+                "Layout-aware extraction",
+                value=st.session_state.retrieval_config["layout_aware"],
+                help="Keep tables, lists and headings as separate retrievable blocks"
+            )
+            
             # Process PDF button
             if st.button("🔄 Process PDF", type="primary"):
-                process_pdf(uploaded_pdf)
+                process_pdf(uploaded_pdf, ocr_dpi, layout_aware)
         
         # Display processing status
         if st.session_state.pdf_processed:
             st.success("✅ PDF processed and ready for questions!")
         
+        # Retrieval settings
+        st.header("⚙️ Retrieval")
+        use_history = st.toggle(
+            "Use chat history",
+            value=True,
+            help="Resolve follow-up questions using the previous turns"
+        )
+        multi_query = st.toggle(
+            "Multi-query search",
+            value=True,
+            help="Search several variants of the question in one batch and fuse the results"
+        )
+        
         # Reset button
         if st.button("🗑️ Reset Chat"):
             reset_session()
+        
+        # Pipeline metrics
+        if metrics.enabled:
+            with st.expander("📊 Pipeline Metrics"):
+                st.code(metrics.to_prometheus(), language="text")
     
     # Main content area
     if st.session_state.pdf_processed and st.session_state.qa_chain:
@@ -133,7 +176,19 @@ def main():
             with st.chat_message("assistant"):
                 with st.spinner("🤔 Thinking..."):
                     try:
-                        result = st.session_state.qa_chain.invoke({"query": user_question})
+                        # Failed turns carry no useful context for retrieval
+                        history = [
+                            (q, a) for q, a in st.session_state.chat_history
+                            if not a.startswith("❌")
+                        ] if use_history else []
+                        result = answer_conversational(
+                            st.session_state.qa_chain,
+                            st.session_state.vector_store,
+                            user_question,
+                            history,
+                            multi_query=multi_query,
+                            k=st.session_state.retrieval_config["k"]
+                        )
                         answer = result['result']
                         
                         st.write(answer)
@@ -143,7 +198,10 @@ def main():
                             with st.expander("📚 View Sources"):
                                 for i, doc in enumerate(result["source_documents"], 1):
                                     snippet = doc.page_content.strip().replace("\n", " ")
-                                    st.write(f"**Source {i}:** {snippet[:200]}...")
+                                    location = ""
+                                    if doc.metadata.get("page"):
+                                        location = f" (page {doc.metadata['page']}, {doc.metadata.get('type', 'text')})"
+                                    st.write(f"**Source {i}{location}:** {snippet[:200]}...")
                         
                         # Add to chat history
                         st.session_state.chat_history.append((user_question, answer))
@@ -166,22 +224,36 @@ def main():
         4. **View Sources**: Expand the sources section to see relevant document excerpts
         """)
 
-def process_pdf(uploaded_pdf):
+def process_pdf(uploaded_pdf, ocr_dpi=OCR_DPI, layout_aware=False):
     """Process the uploaded PDF file"""
+    # Chunking/retrieval settings (tune with: python -m app.evaluate)
+    config = load_retrieval_config()
+    if config["layout_aware"] != layout_aware:
+        # Tuned chunk sizes only apply to the extraction mode they were measured on
+        config.update(
+            chunk_size=DEFAULT_RETRIEVAL_CONFIG["chunk_size"],
+            chunk_overlap=DEFAULT_RETRIEVAL_CONFIG["chunk_overlap"],
+            layout_aware=layout_aware,
+        )
+    
     try:
         # Create a temporary file
         with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
             tmp_file.write(uploaded_pdf.getvalue())
             tmp_file_path = tmp_file.name
         
-        # Step 1: Extract text from PDF
+        # Step 1: Extract text (or typed layout blocks) from PDF
         with st.spinner("📑 Extracting text from PDF..."):
-            text = extract_text_from_pdf(tmp_file_path)
+            if layout_aware:
+                blocks = extract_blocks_from_pdf(tmp_file_path, ocr_dpi=ocr_dpi)
+            else:
+                text = extract_text_from_pdf(tmp_file_path, ocr_dpi=ocr_dpi)
         
         # Clean up temporary file
         os.unlink(tmp_file_path)
         
-        if not text or not text.strip():
+        extracted = blocks if layout_aware else (text or "").strip()
+        if not extracted:
             st.error("❌ Could not extract text from this PDF. Please try a different file.")
             return
         
@@ -189,13 +261,19 @@ def process_pdf(uploaded_pdf):
         
         # Step 2: Split text into chunks
         with st.spinner("✂️ Splitting text into chunks..."):
-            chunks = split_text(text, chunk_size=500, chunk_overlap=50)
+            if layout_aware:
+                chunk_pairs = split_blocks(blocks, chunk_size=config["chunk_size"], chunk_overlap=config["chunk_overlap"])
+                chunks = [chunk for chunk, _ in chunk_pairs]
+                metadatas = [metadata for _, metadata in chunk_pairs]
+            else:
+                chunks = split_text(text, chunk_size=config["chunk_size"], chunk_overlap=config["chunk_overlap"])
+                metadatas = None
         
         st.success(f"✅ Created {len(chunks)} text chunks!")
         
         # Step 3: Create FAISS index
         with st.spinner("🔍 Creating vector embeddings..."):
-            vector_store = create_faiss_from_chunks(chunks)
+            vector_store = create_faiss_from_chunks(chunks, metadatas=metadatas)
         
         if vector_store is None:
             st.error("❌ Failed to create vector embeddings.")
@@ -206,11 +284,12 @@ def process_pdf(uploaded_pdf):
         # Step 4: Initialize QA chain
         with st.spinner("🤖 Initializing AI model..."):
             llm = initialize_instruction_model()
-            qa_chain = create_qa_chain(vector_store, llm)
+            qa_chain = create_qa_chain(vector_store, llm, k=config["k"])
         
         # Store in session state
         st.session_state.vector_store = vector_store
         st.session_state.qa_chain = qa_chain
+        st.session_state.retrieval_config = config  # queries use the k the index was built for
         st.session_state.pdf_processed = True
         st.session_state.chat_history = []  # Reset chat history
         